@@ -7,10 +7,10 @@ Downloads all supported models before starting the API server
 import os
 import sys
 import logging
-from typing import Dict, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
-from transformers import AutoTokenizer, AutoModel, pipeline
 import torch
+from model_hub import download_snapshot
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -26,9 +26,12 @@ SUPPORTED_MODELS = {
     "albert-base-v2": "albert-base-v2"
 }
 
-# Local model storage directory
+# Local model storage directory, laid out as a Hugging Face hub cache
 MODELS_DIR = "./models"
 
+# Number of models downloaded at the same time
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "4"))
+
 
 def ensure_models_directory() -> None:
     """Create models directory if it doesn't exist"""
@@ -37,50 +40,22 @@ def ensure_models_directory() -> None:
         logger.info(f"Created models directory: {MODELS_DIR}")
 
 
-def download_model(model_name: str, model_id: str) -> Dict[str, Any]:
-    """Download and cache a single model"""
-    cache_dir = os.path.join(MODELS_DIR, model_name)
-
+def download_model(model_name: str, model_id: str, position: int = 0) -> str:
+    """Download a single model into the hub cache and return its snapshot path"""
     try:
         logger.info(f"📥 Starting download for: {model_name}")
 
         # Create a progress bar for this model
-        with tqdm(total=3, desc=f"🔧 {model_name}", unit="step", ncols=80) as pbar:
-            # Download tokenizer
-            pbar.set_postfix_str("Downloading tokenizer...")
-            tokenizer = AutoTokenizer.from_pretrained(
-                model_id,
-                cache_dir=cache_dir,
-                local_files_only=False
-            )
-            pbar.update(1)
-
-            # Download model
-            pbar.set_postfix_str("Downloading model...")
-            model = AutoModel.from_pretrained(
-                model_id,
-                cache_dir=cache_dir,
-                local_files_only=False
-            )
-            pbar.update(1)
-
-            # Create pipeline
-            pbar.set_postfix_str("Creating pipeline...")
-            pipe = pipeline(
-                "feature-extraction",
-                model=model,
-                tokenizer=tokenizer,
-                device=0 if torch.cuda.is_available() else -1
-            )
+        with tqdm(total=1, desc=f"🔧 {model_name}", unit="step", ncols=80,
+                  position=position, leave=False) as pbar:
+            # Fetch the files only; loading the weights is left to the API server
+            pbar.set_postfix_str("Downloading files...")
+            model_path = download_snapshot(model_id, MODELS_DIR)
             pbar.update(1)
             pbar.set_postfix_str("✅ Complete")
 
         logger.info(f"✅ Successfully downloaded: {model_name}")
-        return {
-            "tokenizer": tokenizer,
-            "model": model,
-            "pipeline": pipe
-        }
+        return model_path
 
     except Exception as e:
         logger.error(f"❌ Error downloading {model_name}: {str(e)}")
@@ -101,12 +76,19 @@ def download_all_models() -> None:
     total_models = len(SUPPORTED_MODELS)
     failed_models = []
 
-    # Overall progress bar
-    with tqdm(total=total_models, desc="🌟 Overall Progress", unit="model", ncols=80) as overall_pbar:
-        for i, (model_name, model_id) in enumerate(SUPPORTED_MODELS.items(), 1):
+    # Models share nothing, so their downloads run concurrently
+    print(f"⚡ Downloading up to {DOWNLOAD_WORKERS} models at a time")
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor, \
+            tqdm(total=total_models, desc="🌟 Overall Progress", unit="model",
+                 ncols=80, position=0) as overall_pbar:
+        futures = {
+            executor.submit(download_model, model_name, model_id, i): model_name
+            for i, (model_name, model_id) in enumerate(SUPPORTED_MODELS.items(), 1)
+        }
+        for future in as_completed(futures):
+            model_name = futures[future]
             try:
-                print(f"\n📥 [{i}/{total_models}] Processing: {model_name}")
-                download_model(model_name, model_id)
+                future.result()
                 overall_pbar.update(1)
                 overall_pbar.set_postfix_str(f"✅ {model_name}")
 
@@ -114,7 +96,6 @@ def download_all_models() -> None:
                 failed_models.append((model_name, str(e)))
                 overall_pbar.update(1)
                 overall_pbar.set_postfix_str(f"❌ {model_name}")
-                continue
 
     print("\n" + "=" * 50)
     if failed_models:
@@ -62,8 +62,7 @@ def main() -> None:
                     result = response.json()
                     if "embeddings" in result and result["embeddings"]:
                         embeddings = result["embeddings"]
-                        print(
-                            f"✅ Success! Shape: {len(embeddings)} x {len(embeddings[0])}")
+                        print(f"✅ Success! Size: {len(embeddings)}")
                         print(f"⏱️  Time: {end_time - start_time:.2f}s")
                     else:
                         print(f"⚠️  Response: {result}")
@@ -5,13 +5,24 @@ A FastAPI web service for running BERT and RoBERTa models
 """
 
 import os
+import gc
+import asyncio
+import functools
+import hashlib
 import logging
-from typing import Dict, List, Optional, AsyncGenerator, Any
+import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Annotated, Dict, List, Literal, Optional, AsyncGenerator, Any, Callable, Tuple, Union
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from transformers import AutoTokenizer, AutoModel, pipeline
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, Field
+from transformers import AutoTokenizer, AutoModel
+from transformers.utils import is_accelerate_available
 import torch
+from model_hub import download_snapshot
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -27,11 +38,88 @@ SUPPORTED_MODELS = {
     "albert-base-v2": "albert-base-v2"
 }
 
-# Local model storage directory
+# Local model storage directory, laid out as a Hugging Face hub cache
 MODELS_DIR = "./models"
 
-# Global model cache
-model_cache: Dict[str, Dict[str, Any]] = {}
+# Device models run on
+DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+# CPU threads per worker process for inference; by default the cores are split
+# across the Uvicorn workers so WEB_CONCURRENCY * TORCH_NUM_THREADS ≈ cores
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+TORCH_NUM_THREADS = int(os.getenv(
+    "TORCH_NUM_THREADS", str(max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY))))
+
+# Weight precision: "auto" (fp16 on CUDA, fp32 on CPU), "fp32", "fp16" or
+# "int8" (dynamically quantized linear layers, CPU only; fp16 on CUDA)
+MODEL_PRECISIONS = ("auto", "fp32", "fp16", "int8")
+MODEL_PRECISION = os.getenv("MODEL_PRECISION", "auto").strip().lower()
+if MODEL_PRECISION not in MODEL_PRECISIONS:
+    logger.warning(
+        f"⚠️  Ignoring unsupported MODEL_PRECISION={MODEL_PRECISION!r}, "
+        f"expected one of: {', '.join(MODEL_PRECISIONS)}")
+    MODEL_PRECISION = "auto"
+if MODEL_PRECISION == "fp32" or (MODEL_PRECISION != "fp16" and DEVICE.type == "cpu"):
+    MODEL_DTYPE = torch.float32
+else:
+    MODEL_DTYPE = torch.float16
+QUANTIZE_INT8 = MODEL_PRECISION == "int8" and DEVICE.type == "cpu"
+
+# Models converted to MODEL_DTYPE are saved here on first load, so later starts
+# memory-map the converted weights instead of converting them again
+CONVERTED_MODELS_DIR = os.path.join(MODELS_DIR, ".converted")
+
+# torch.compile mode for loaded models: "none", "default", "reduce-overhead" or
+# "max-autotune"; compiled kernels are cached on disk next to the models
+TORCH_COMPILE_MODES = ("none", "default", "reduce-overhead", "max-autotune")
+TORCH_COMPILE = os.getenv("TORCH_COMPILE", "none").strip().lower()
+if TORCH_COMPILE not in TORCH_COMPILE_MODES:
+    logger.warning(
+        f"⚠️  Ignoring unsupported TORCH_COMPILE={TORCH_COMPILE!r}, "
+        f"expected one of: {', '.join(TORCH_COMPILE_MODES)}")
+    TORCH_COMPILE = "none"
+os.environ.setdefault(
+    "TORCHINDUCTOR_CACHE_DIR", os.path.abspath(os.path.join(MODELS_DIR, ".torchinductor")))
+
+# Models loaded at startup: "all", "none" or a comma-separated list of names
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "all")
+
+# Global model cache, ordered from least to most recently used; loader threads,
+# the inference thread and the event loop all use it, so every access holds
+# model_cache_lock (only briefly, never while a model runs or moves)
+model_cache: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+model_cache_lock = threading.Lock()
+
+# GPU budget: once more than MAX_GPU_MODELS models are on the GPU, or more than
+# MAX_GPU_MEMORY_MB is allocated, the least recently used models are moved to
+# the CPU until they are needed again (0 disables a limit)
+MAX_GPU_MODELS = int(os.getenv("MAX_GPU_MODELS", "0"))
+MAX_GPU_MEMORY_MB = int(os.getenv("MAX_GPU_MEMORY_MB", "0"))
+
+# Bounded thread pool for blocking inference calls, sized to the number of
+# forwards the device can usefully run at once
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))
+executor = ThreadPoolExecutor(
+    max_workers=INFERENCE_WORKERS, thread_name_prefix="inference")
+
+# Dynamic batching: concurrent requests for the same model are coalesced into
+# one forward pass of up to MAX_BATCH texts, waiting at most MAX_WAIT_MS
+MAX_BATCH = int(os.getenv("MAX_BATCH", "16"))
+MAX_WAIT_MS = float(os.getenv("MAX_WAIT_MS", "10"))
+
+# Inputs are truncated to this many tokens to cap the cost of a single text
+MAX_LENGTH = int(os.getenv("MAX_LENGTH", "512"))
+
+# Maximum number of texts in one request; larger lists are rejected with 422
+MAX_TEXTS = int(os.getenv("MAX_TEXTS", "64"))
+
+# LRU cache of embeddings keyed by model and text digest, so repeated inputs
+# skip tokenization and the forward pass entirely; bounded both by entries and
+# by RESULT_CACHE_MB of tensor memory (0 disables it)
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_MB = int(os.getenv("RESULT_CACHE_MB", "256"))
+result_cache: OrderedDict[Tuple[str, bytes], torch.Tensor] = OrderedDict()
+result_cache_bytes = 0
 
 
 @asynccontextmanager
@@ -39,17 +127,24 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     """Application lifespan manager"""
     # Startup
     ensure_models_directory()
+    configure_cpu_threads()
 
-    # Check for pre-downloaded models
-    available_models = []
-    for model_name in SUPPORTED_MODELS.keys():
-        model_path = os.path.join(MODELS_DIR, model_name)
-        if os.path.exists(model_path) and os.listdir(model_path):
-            available_models.append(model_name)
+    # Check for pre-downloaded models with a single directory read
+    with os.scandir(MODELS_DIR) as entries:
+        present = {entry.name for entry in entries if entry.is_dir()}
+    available_models = [
+        model_name for model_name, model_id in SUPPORTED_MODELS.items()
+        if hub_folder_name(model_id) in present
+    ]
 
     logger.info("🚀 LogPrompt API starting...")
     logger.info(f"📁 Models directory: {os.path.abspath(MODELS_DIR)}")
     logger.info(f"🖥️  CUDA available: {torch.cuda.is_available()}")
+    logger.info(f"⚙️  torch.compile mode: {TORCH_COMPILE}")
+    if DEVICE.type == "cpu":
+        logger.info(f"🧵 Inference threads: {torch.get_num_threads()}")
+    logger.info(
+        f"🔢 Model precision: {'int8' if QUANTIZE_INT8 else str(MODEL_DTYPE).removeprefix('torch.')}")
     logger.info(
         f"📦 Pre-downloaded models: {len(available_models)}/{len(SUPPORTED_MODELS)}")
 
@@ -59,36 +154,155 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
         logger.warning("⚠️  No pre-downloaded models found!")
         logger.info("💡 Run 'python download_models.py' to download all models first")
 
+    # Load models before accepting traffic so no request pays the load cost
+    # Only pre-downloaded models are preloaded, so a fresh deploy starts answering
+    # right away instead of downloading every model first
+    preload_models = get_preload_models()
+    missing_models = [name for name in preload_models if name not in available_models]
+    if missing_models:
+        logger.warning(
+            f"⚠️  Not preloading models that are not downloaded: {', '.join(missing_models)}")
+        logger.info("💡 Load them with POST /load-model/{model_name}")
+    preload_models = [name for name in preload_models if name in available_models]
+    if preload_models:
+        logger.info(f"🔧 Preloading models: {', '.join(preload_models)}")
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *(loop.run_in_executor(
+                None, functools.partial(download_and_cache_model, model_name, local_files_only=True))
+              for model_name in preload_models),
+            return_exceptions=True
+        )
+        failed_models = [
+            model_name for model_name, result in zip(preload_models, results)
+            if isinstance(result, BaseException)
+        ]
+        if failed_models:
+            logger.warning(f"⚠️  Failed to preload: {', '.join(failed_models)}")
+
     logger.info("✅ LogPrompt API started successfully!")
     yield
     # Shutdown
     logger.info("👋 LogPrompt API shutting down...")
 
 
-# Create FastAPI app with lifespan
+# Create FastAPI app with lifespan; orjson encodes float arrays several times
+# faster than the json module
 app = FastAPI(
     title="LogPrompt - Transformer Models API",
     description="Simple API for running BERT and RoBERTa models",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 
 class ModelRequest(BaseModel):
-    text: str
+    # A list of texts is embedded together and answered with one result per text
+    text: Union[str, Annotated[List[str], Field(min_length=1, max_length=MAX_TEXTS)]]
     model_name: str
     task: str = "feature-extraction"  # Default task
 
 
 class ModelResponse(BaseModel):
     model_name: str
-    text: str
+    text: Union[str, List[str]]
     task: str
-    embeddings: Optional[List[List[float]]] = None
-    features: Optional[Dict] = None
+    # One mean-pooled vector, or one vector per token with pool=none; a list
+    # of those when the request has a list of texts
+    embeddings: Optional[Union[
+        List[float], List[List[float]], List[List[List[float]]]]] = None
+    features: Optional[Union[Dict, List[Dict]]] = None
     error: Optional[str] = None
 
 
+class MicroBatcher:
+    """Accumulate concurrent texts per model and run them as a single batch"""
+
+    def __init__(
+        self,
+        process_batch: Callable[[str, List[str]], List[Any]],
+        max_batch: int,
+        max_wait_ms: float
+    ) -> None:
+        self.process_batch = process_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queues: Dict[str, asyncio.Queue[Tuple[str, asyncio.Future[Any]]]] = {}
+        self._workers: Dict[str, asyncio.Task[None]] = {}
+
+    async def submit(self, model_name: str, text: str) -> Any:
+        """Queue a text for the given model and wait for its own output"""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Queues and worker tasks belong to the loop that created them
+            self._loop = loop
+            self._queues.clear()
+            self._workers.clear()
+
+        if model_name not in self._queues:
+            self._queues[model_name] = asyncio.Queue()
+            self._workers[model_name] = loop.create_task(
+                self._worker(model_name, self._queues[model_name]))
+
+        future: asyncio.Future[Any] = loop.create_future()
+        await self._queues[model_name].put((text, future))
+        return await future
+
+    async def _worker(
+        self,
+        model_name: str,
+        queue: asyncio.Queue[Tuple[str, asyncio.Future[Any]]]
+    ) -> None:
+        """Drain the queue into batches and resolve each caller's future"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Skip callers that gave up while waiting
+            batch = [(text, future) for text, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            try:
+                outputs = await loop.run_in_executor(
+                    executor, self.process_batch, model_name,
+                    [text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), output in zip(batch, outputs):
+                if not future.done():
+                    future.set_result(output)
+
+
+def configure_cpu_threads() -> None:
+    """Size torch's CPU thread pools for this worker process"""
+    if DEVICE.type != "cpu":
+        return
+
+    torch.set_num_threads(TORCH_NUM_THREADS)
+    try:
+        # A BERT forward is a chain of ops, so only intra-op threads help
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Can only be set once per process, before any parallel work
+        logger.warning("⚠️  Inter-op threads were already configured, leaving them as they are")
+
+
 def ensure_models_directory() -> None:
     """Create models directory if it doesn't exist"""
     if not os.path.exists(MODELS_DIR):
@@ -96,16 +310,111 @@ def ensure_models_directory() -> None:
         logger.info(f"Created models directory: {MODELS_DIR}")
 
 
-def download_and_cache_model(model_name: str) -> Dict[str, Any]:
+def get_preload_models() -> List[str]:
+    """Resolve PRELOAD_MODELS into the list of models to load at startup"""
+    value = PRELOAD_MODELS.strip().lower()
+    if value == "all":
+        return list(SUPPORTED_MODELS.keys())
+    if value in ("", "none"):
+        return []
+
+    model_names = [name.strip() for name in value.split(",") if name.strip()]
+    unknown_models = [name for name in model_names if name not in SUPPORTED_MODELS]
+    if unknown_models:
+        logger.warning(
+            f"⚠️  Ignoring unsupported models in PRELOAD_MODELS: {', '.join(unknown_models)}")
+    return [name for name in model_names if name in SUPPORTED_MODELS]
+
+
+def hub_folder_name(model_id: str) -> str:
+    """Name of the folder a model occupies in the hub cache"""
+    return "models--" + model_id.replace("/", "--")
+
+
+def load_tokenizer(source: str) -> Any:
+    """Load the fast (Rust) tokenizer, which encodes a whole batch in parallel"""
+    tokenizer = AutoTokenizer.from_pretrained(source, use_fast=True)
+    if not tokenizer.is_fast:
+        logger.warning(f"⚠️  No fast tokenizer for {source}, using the slow Python one")
+    return tokenizer
+
+
+def load_model_weights(source: str, **kwargs: Any) -> Any:
+    """Load model weights on the CPU, then move them to DEVICE in one step"""
+    try:
+        # safetensors are memory-mapped and copied tensor by tensor, whereas a
+        # pickled pytorch_model.bin is first read into RAM in full
+        model = AutoModel.from_pretrained(
+            source,
+            torch_dtype=MODEL_DTYPE,
+            # Skips allocating randomly initialized weights first; needs accelerate
+            low_cpu_mem_usage=is_accelerate_available(),
+            use_safetensors=True,
+            **kwargs
+        )
+    except OSError:
+        logger.info(f"ℹ️  No safetensors weights in {source}, loading pytorch_model.bin")
+        model = AutoModel.from_pretrained(
+            source,
+            torch_dtype=MODEL_DTYPE,
+            low_cpu_mem_usage=is_accelerate_available(),
+            use_safetensors=False,
+            **kwargs
+        )
+    model.eval()
+    if QUANTIZE_INT8:
+        # int8 weights for every nn.Linear, activations quantized on the fly
+        model = torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8)
+    model.to(DEVICE)
+    if DEVICE.type == "cuda":
+        # Release allocator blocks left over from the load
+        torch.cuda.empty_cache()
+    if TORCH_COMPILE != "none":
+        # Compiles in place on the first forward, so the model keeps its class
+        # and can still be moved between devices; dynamic avoids a recompile per length
+        model.compile(mode=TORCH_COMPILE, dynamic=True)
+    return model
+
+
+def load_converted_model(model_name: str, model_path: str) -> Any:
+    """Load a model, reusing or saving a copy of its weights in MODEL_DTYPE"""
+    # Snapshot folders are named after the revision, so an update is reconverted
+    revision = os.path.basename(os.path.normpath(model_path))
+    converted_path = os.path.join(
+        CONVERTED_MODELS_DIR,
+        f"{model_name}-{revision[:12]}-{str(MODEL_DTYPE).removeprefix('torch.')}")
+    if os.path.isdir(converted_path):
+        return load_model_weights(converted_path)
+
+    model = load_model_weights(model_path)
+    # Checkpoints are float32, so only a float16 copy saves work on the next start
+    if MODEL_DTYPE == torch.float16:
+        # Write to a private folder first so a partial copy is never loaded
+        temp_path = f"{converted_path}.{os.getpid()}.tmp"
+        try:
+            model.save_pretrained(temp_path, safe_serialization=True)
+            os.replace(temp_path, converted_path)
+            logger.info(f"💾 Saved converted weights for {model_name} to {converted_path}")
+        except Exception as e:
+            # The copy is only an optimisation, so the loaded model is kept either way
+            shutil.rmtree(temp_path, ignore_errors=True)
+            if not os.path.isdir(converted_path):
+                logger.warning(
+                    f"⚠️  Could not save converted weights for {model_name}: {str(e)}")
+    return model
+
+
+def download_and_cache_model(model_name: str, local_files_only: bool = False) -> Dict[str, Any]:
     """Download and cache a model if not already cached"""
-    if model_name in model_cache:
-        return model_cache[model_name]
+    with model_cache_lock:
+        if model_name in model_cache:
+            return model_cache[model_name]
 
     if model_name not in SUPPORTED_MODELS:
         raise ValueError(f"Model {model_name} not supported")
 
     model_id = SUPPORTED_MODELS[model_name]
-    cache_dir = os.path.join(MODELS_DIR, model_name)
 
     try:
         logger.info(f"📥 Loading model: {model_name}")
@@ -114,76 +423,179 @@ def download_and_cache_model(model_name: str) -> Dict[str, Any]:
         # Check if model exists locally first
         try:
             # Try to load from local cache first
-            with tqdm(total=3, desc=f"🔧 Loading {model_name}", unit="step", ncols=80) as pbar:
+            model_path = download_snapshot(model_id, MODELS_DIR, local_files_only=True)
+            with tqdm(total=2, desc=f"🔧 Loading {model_name}", unit="step", ncols=80) as pbar:
                 pbar.set_postfix_str("Loading tokenizer...")
-                tokenizer = AutoTokenizer.from_pretrained(
-                    cache_dir,
-                    local_files_only=True
-                )
+                tokenizer = load_tokenizer(model_path)
                 pbar.update(1)
 
                 pbar.set_postfix_str("Loading model...")
-                model = AutoModel.from_pretrained(
-                    cache_dir,
-                    local_files_only=True
-                )
+                model = load_converted_model(model_name, model_path)
                 pbar.update(1)
 
-                pbar.set_postfix_str("Creating pipeline...")
-                pipe = pipeline(
-                    "feature-extraction",
-                    model=model,
-                    tokenizer=tokenizer,
-                    device=0 if torch.cuda.is_available() else -1
-                )
-                pbar.update(1)
                 pbar.set_postfix_str("✅ Loaded from cache")
             logger.info(f"✅ Loaded {model_name} from local cache")
 
         except Exception:
+            if local_files_only:
+                raise
             # If local loading fails, download from hub
             logger.info(
                 f"📥 Local cache not found, downloading {model_name} from Hugging Face Hub...")
             with tqdm(total=3, desc=f"⬇️  Downloading {model_name}", unit="step", ncols=80) as pbar:
-                pbar.set_postfix_str("Downloading tokenizer...")
-                tokenizer = AutoTokenizer.from_pretrained(
-                    model_id,
-                    cache_dir=cache_dir,
-                    local_files_only=False
-                )
+                pbar.set_postfix_str("Downloading files...")
+                model_path = download_snapshot(model_id, MODELS_DIR)
                 pbar.update(1)
 
-                pbar.set_postfix_str("Downloading model...")
-                model = AutoModel.from_pretrained(
-                    model_id,
-                    cache_dir=cache_dir,
-                    local_files_only=False
-                )
+                pbar.set_postfix_str("Loading tokenizer...")
+                tokenizer = load_tokenizer(model_path)
                 pbar.update(1)
 
-                pbar.set_postfix_str("Creating pipeline...")
-                pipe = pipeline(
-                    "feature-extraction",
-                    model=model,
-                    tokenizer=tokenizer,
-                    device=0 if torch.cuda.is_available() else -1
-                )
+                pbar.set_postfix_str("Loading model...")
+                model = load_converted_model(model_name, model_path)
                 pbar.update(1)
+
                 pbar.set_postfix_str("✅ Downloaded")
             logger.info(f"✅ Downloaded and cached {model_name}")
 
-        model_cache[model_name] = {
+        model_data: Dict[str, Any] = {
+            "path": model_path,
             "tokenizer": tokenizer,
             "model": model,
-            "pipeline": pipe
+            "device": DEVICE,
+            # Held while the model runs or moves between devices
+            "lock": threading.Lock()
         }
-        return model_cache[model_name]
+        with model_cache_lock:
+            model_cache[model_name] = model_data
+        offload_idle_models(keep=model_name)
+        return model_data
 
     except Exception as e:
         logger.error(f"❌ Error loading model {model_name}: {str(e)}")
         raise
 
 
+def gpu_over_budget(models: List[Tuple[str, Dict[str, Any]]], keep: str) -> bool:
+    """Check the GPU limits, counting the model in use as resident"""
+    resident = sum(
+        1 for model_name, model_data in models
+        if model_name == keep or model_data["device"].type == "cuda"
+    )
+    if MAX_GPU_MODELS and resident > MAX_GPU_MODELS:
+        return True
+    return bool(MAX_GPU_MEMORY_MB) and \
+        torch.cuda.memory_allocated() > MAX_GPU_MEMORY_MB * 1024 * 1024
+
+
+def offload_idle_models(keep: str) -> None:
+    """Move least recently used models to the CPU until the GPU budget is met"""
+    if DEVICE.type != "cuda":
+        return
+
+    # Work from a snapshot so other threads can load and use models meanwhile
+    with model_cache_lock:
+        models = list(model_cache.items())
+
+    for model_name, model_data in models:
+        if not gpu_over_budget(models, keep):
+            break
+        if model_name == keep or model_data["device"].type != "cuda":
+            continue
+        # Leave models alone while they are running a batch
+        if not model_data["lock"].acquire(blocking=False):
+            continue
+        try:
+            model_data["model"].to("cpu")
+            model_data["device"] = torch.device("cpu")
+        finally:
+            model_data["lock"].release()
+        gc.collect()
+        torch.cuda.empty_cache()
+        logger.info(f"📤 Moved {model_name} to CPU to stay within the GPU budget")
+
+
+def get_loaded_model(model_name: str) -> Dict[str, Any]:
+    """Return a loaded model or raise the matching HTTP error"""
+    if model_name not in SUPPORTED_MODELS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Model {model_name} not supported. "
+            f"Available models: {list(SUPPORTED_MODELS.keys())}")
+
+    # Models are loaded at startup or through /load-model
+    with model_cache_lock:
+        model_data = model_cache.get(model_name)
+        if model_data is not None:
+            model_cache.move_to_end(model_name)
+    if model_data is None:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Model {model_name} is not loaded. "
+            f"Load it with POST /load-model/{model_name}")
+    return model_data
+
+
+def loaded_model_names() -> List[str]:
+    """Names of the loaded models, least recently used first"""
+    with model_cache_lock:
+        return list(model_cache.keys())
+
+
+def extract_features(model_name: str, texts: List[str]) -> List[torch.Tensor]:
+    """Run one batched feature-extraction pass and strip padding per text"""
+    with model_cache_lock:
+        model_data = model_cache[model_name]
+    tokenizer = model_data["tokenizer"]
+    # One call into the tokenizer for the whole batch, padded to its longest text;
+    # never longer than the model's position embeddings allow
+    tokens = tokenizer(
+        texts, padding=True, truncation=True,
+        max_length=min(MAX_LENGTH, tokenizer.model_max_length), return_tensors="pt")
+    with model_data["lock"]:
+        if model_data["device"] != DEVICE:
+            # Make room first, then bring the offloaded model back
+            offload_idle_models(keep=model_name)
+            model_data["model"].to(DEVICE)
+            model_data["device"] = DEVICE
+            logger.info(f"📥 Moved {model_name} back to {DEVICE}")
+
+        # Grad mode is thread-local, so it is switched off here in the worker thread
+        with torch.inference_mode():
+            # One device-to-host copy per batch; cached results stay off the GPU
+            outputs = model_data["model"](**tokens.to(DEVICE)).last_hidden_state.cpu()
+    lengths = tokens["attention_mask"].sum(dim=1).tolist()
+    # Copies, so a cached text does not keep the whole padded batch alive
+    return [output[:length].clone() for output, length in zip(outputs, lengths)]
+
+
+batcher = MicroBatcher(extract_features, MAX_BATCH, MAX_WAIT_MS)
+
+
+async def embed(model_name: str, text: str) -> torch.Tensor:
+    """Return embeddings for a text, reusing the cached result for repeats"""
+    global result_cache_bytes
+    key = (model_name, hashlib.blake2b(text.encode(), digest_size=16).digest())
+    embeddings = result_cache.get(key)
+    if embeddings is not None:
+        result_cache.move_to_end(key)
+        return embeddings
+
+    embeddings = await batcher.submit(model_name, text)
+    # Insert and eviction run without yielding to the event loop, so no lock
+    if RESULT_CACHE_SIZE > 0 and RESULT_CACHE_MB > 0:
+        previous = result_cache.pop(key, None)
+        if previous is not None:
+            result_cache_bytes -= previous.nbytes
+        result_cache[key] = embeddings
+        result_cache_bytes += embeddings.nbytes
+        while len(result_cache) > RESULT_CACHE_SIZE or \
+                result_cache_bytes > RESULT_CACHE_MB * 1024 * 1024:
+            _, evicted = result_cache.popitem(last=False)
+            result_cache_bytes -= evicted.nbytes
+    return embeddings
+
+
 @app.get("/")
 async def root() -> Dict[str, Any]:
     """Root endpoint"""
@@ -199,51 +611,63 @@ async def list_models() -> Dict[str, Any]:
     """List all supported models"""
     return {
         "supported_models": list(SUPPORTED_MODELS.keys()),
-        "loaded_models": list(model_cache.keys())
+        "loaded_models": loaded_model_names()
     }
 
 
 @app.post("/predict", response_model=ModelResponse)
-async def predict(request: ModelRequest) -> ModelResponse:
+async def predict(
+    request: ModelRequest,
+    pool: Literal["mean", "none"] = "mean"
+) -> Union[ModelResponse, Response]:
     """Generate predictions using specified model"""
     try:
-        # Validate model name
-        if request.model_name not in SUPPORTED_MODELS:
-            raise HTTPException(
-                status_code=400, detail=f"Model {
-                    request.model_name} not supported. Available models: {
-                    list(
-                        SUPPORTED_MODELS.keys())}")
+        # Validate model name and make sure it is loaded
+        model_data = get_loaded_model(request.model_name)
 
-        # Load model if not cached
-        model_data = download_and_cache_model(request.model_name)
+        # Generate embeddings/features off the event loop
+        loop = asyncio.get_running_loop()
 
-        # Generate embeddings/features
-        pipeline_obj = model_data["pipeline"]
+        texts = [request.text] if isinstance(request.text, str) else request.text
 
         if request.task == "feature-extraction":
-            # Get embeddings
-            embeddings = pipeline_obj(request.text)
-            return ModelResponse(
-                model_name=request.model_name,
-                text=request.text,
-                task=request.task,
-                embeddings=embeddings
-            )
+            # Get embeddings; the texts are batched together and with concurrent requests
+            outputs = [
+                output.to(torch.float32) for output in await asyncio.gather(
+                    *(embed(request.model_name, text) for text in texts))
+            ]
+            if pool == "mean":
+                # Padding is already stripped, so this is the attention-masked mean
+                outputs = [output.mean(dim=0) for output in outputs]
+            # orjson writes the ndarrays directly, skipping the conversion to
+            # nested lists and their validation against ModelResponse
+            arrays = [output.numpy() for output in outputs]
+            return ORJSONResponse({
+                "model_name": request.model_name,
+                "text": request.text,
+                "task": request.task,
+                "embeddings": arrays[0] if isinstance(request.text, str) else arrays,
+                "features": None,
+                "error": None
+            })
         else:
             # For other tasks, return basic features
             tokenizer = model_data["tokenizer"]
-            tokens = tokenizer.tokenize(request.text)
+            features = []
+            for text in texts:
+                tokens = await loop.run_in_executor(
+                    executor, tokenizer.tokenize, text)
+                features.append({
+                    "num_tokens": len(tokens),
+                    "tokens": tokens[:50],  # Limit tokens for response size
+                    "text_length": len(text)
+                })
 
             return ModelResponse(
                 model_name=request.model_name,
                 text=request.text,
                 task=request.task,
-                features={
-                    "num_tokens": len(tokens),
-                    "tokens": tokens[:50],  # Limit tokens for response size
-                    "text_length": len(request.text)
-                }
+                features=features[0] if isinstance(request.text, str) else features
             )
 
     except HTTPException:
@@ -260,6 +684,30 @@ async def predict(request: ModelRequest) -> ModelResponse:
         )
 
 
+@app.post("/predict_raw")
+async def predict_raw(request: ModelRequest) -> Response:
+    """Return embeddings as raw float16 bytes, with the shape in X-Shape"""
+    try:
+        if not isinstance(request.text, str):
+            raise HTTPException(
+                status_code=400,
+                detail="/predict_raw takes a single text; use /predict for a list")
+        get_loaded_model(request.model_name)
+        embeddings = await embed(request.model_name, request.text)
+        rows, columns = embeddings.shape
+        return Response(
+            content=embeddings.to(torch.float16).numpy().tobytes(),
+            media_type="application/octet-stream",
+            headers={"X-Shape": f"{rows},{columns}", "X-Dtype": "float16"}
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Error processing request: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.post("/load-model/{model_name}")
 async def load_model(model_name: str) -> Dict[str, str]:
     """Preload a specific model"""
@@ -270,7 +718,8 @@ async def load_model(model_name: str) -> Dict[str, str]:
                 detail=f"Model {model_name} not supported"
             )
 
-        download_and_cache_model(model_name)
+        await asyncio.get_running_loop().run_in_executor(
+            None, download_and_cache_model, model_name)
         return {"message": f"Model {model_name} loaded successfully"}
 
     except Exception as e:
@@ -282,10 +731,18 @@ async def health_check() -> Dict[str, Any]:
     """Health check endpoint"""
     return {
         "status": "healthy",
-        "models_loaded": len(model_cache),
+        "models_loaded": len(loaded_model_names()),
         "cuda_available": torch.cuda.is_available()
     }
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        # Every worker process loads its own copy of the preloaded models
+        workers=WEB_CONCURRENCY,
+        loop="uvloop",
+        http="httptools"
+    )
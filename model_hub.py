@@ -0,0 +1,38 @@
+"""
+Model file downloads shared by the API server and download_models.py
+"""
+
+import os
+from typing import List
+from huggingface_hub import snapshot_download
+
+# Top-level repo files needed to run a model; subfolders only hold other
+# formats (ONNX, Core ML, ...) that are never loaded. Pickled *.bin weights
+# are only fetched for repos that have no safetensors
+MODEL_FILE_PATTERNS = ["*.json", "*.txt", "*.model", "*.safetensors"]
+
+
+def fetch_snapshot(
+    model_id: str,
+    cache_dir: str,
+    allow_patterns: List[str],
+    local_files_only: bool
+) -> str:
+    """Fetch the matching files of a model into the hub cache"""
+    return snapshot_download(
+        repo_id=model_id,
+        cache_dir=cache_dir,
+        allow_patterns=allow_patterns,
+        ignore_patterns=["*/*"],
+        local_files_only=local_files_only,
+        max_workers=8
+    )
+
+
+def download_snapshot(model_id: str, cache_dir: str, local_files_only: bool = False) -> str:
+    """Fetch a model's files into the hub cache and return the snapshot path"""
+    model_path = fetch_snapshot(model_id, cache_dir, MODEL_FILE_PATTERNS, local_files_only)
+    if not any(name.endswith(".safetensors") for name in os.listdir(model_path)):
+        model_path = fetch_snapshot(
+            model_id, cache_dir, MODEL_FILE_PATTERNS + ["*.bin"], local_files_only)
+    return model_path
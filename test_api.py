@@ -54,10 +54,7 @@ def test_api() -> None:
     if "embeddings" in result and result["embeddings"]:
         print(f"Model: {result['model_name']}")
         print(f"Text: {result['text']}")
-        embeddings_shape = (
-            f"{len(result['embeddings'])} x {len(result['embeddings'][0])}"
-        )
-        print(f"Embeddings shape: {embeddings_shape}")
+        print(f"Embedding size: {len(result['embeddings'])}")
     else:
         print(f"Response: {result}")
     print()
@@ -78,10 +75,7 @@ def test_api() -> None:
     if "embeddings" in result and result["embeddings"]:
         print(f"Model: {result['model_name']}")
         print(f"Text: {result['text']}")
-        embeddings_shape = (
-            f"{len(result['embeddings'])} x {len(result['embeddings'][0])}"
-        )
-        print(f"Embeddings shape: {embeddings_shape}")
+        print(f"Embedding size: {len(result['embeddings'])}")
     else:
         print(f"Response: {result}")
 
@@ -2,13 +2,26 @@
 Test configuration for LogPrompt API
 """
 
-from typing import Any, Dict
+import asyncio
+from collections import OrderedDict
+from typing import Any, Dict, List
+import pytest
 from fastapi.testclient import TestClient
-from main import app
+import torch
+import main
+from main import app, MicroBatcher
 
 client = TestClient(app)
 
 
+@pytest.fixture(scope="module")
+def bert_base_loaded() -> None:
+    """Load bert-base-uncased once, skipping tests that need it if that fails"""
+    response = client.post("/load-model/bert-base-uncased")
+    if response.status_code != 200:
+        pytest.skip("bert-base-uncased could not be loaded")
+
+
 def test_root_endpoint() -> None:
     """Test the root endpoint"""
     response = client.get("/")
@@ -36,6 +49,7 @@ def test_health_endpoint() -> None:
     assert data["status"] == "healthy"
 
 
+@pytest.mark.usefixtures("bert_base_loaded")
 def test_predict_endpoint() -> None:
     """Test the prediction endpoint"""
     test_request = {
@@ -51,6 +65,109 @@ def test_predict_endpoint() -> None:
     assert "text" in data
 
 
+@pytest.mark.usefixtures("bert_base_loaded")
+def test_predict_pooling() -> None:
+    """Test mean pooling by default and per-token embeddings with pool=none"""
+    test_request = {
+        "text": "Hello world",
+        "model_name": "bert-base-uncased",
+        "task": "feature-extraction"
+    }
+
+    response = client.post("/predict", json=test_request)
+    assert response.status_code == 200
+    pooled = response.json()["embeddings"]
+    assert all(isinstance(value, float) for value in pooled)
+
+    response = client.post("/predict?pool=none", json=test_request)
+    assert response.status_code == 200
+    embeddings = response.json()["embeddings"]
+    assert len(embeddings) > 1
+    assert len(embeddings[0]) == len(pooled)
+
+
+@pytest.mark.usefixtures("bert_base_loaded")
+def test_predict_text_list() -> None:
+    """Test prediction for a list of texts"""
+    test_request = {
+        "text": ["Hello world", "A second, somewhat longer sentence"],
+        "model_name": "bert-base-uncased",
+        "task": "feature-extraction"
+    }
+
+    response = client.post("/predict", json=test_request)
+    assert response.status_code == 200
+    data: Dict[str, Any] = response.json()
+    assert data["text"] == test_request["text"]
+    assert len(data["embeddings"]) == 2
+    assert len(data["embeddings"][0]) == len(data["embeddings"][1])
+
+
+def test_predict_too_many_texts() -> None:
+    """Test that a list of texts longer than MAX_TEXTS is rejected"""
+    test_request = {
+        "text": ["Hello world"] * (main.MAX_TEXTS + 1),
+        "model_name": "bert-base-uncased",
+        "task": "feature-extraction"
+    }
+
+    response = client.post("/predict", json=test_request)
+    assert response.status_code == 422
+
+
+def test_predict_raw_text_list() -> None:
+    """Test that /predict_raw rejects a list of texts"""
+    test_request = {
+        "text": ["Hello world", "Another text"],
+        "model_name": "bert-base-uncased"
+    }
+
+    response = client.post("/predict_raw", json=test_request)
+    assert response.status_code == 400
+    assert "single text" in response.json()["detail"]
+
+
+def test_predict_invalid_pool() -> None:
+    """Test prediction with an unknown pooling mode"""
+    test_request = {
+        "text": "Hello world",
+        "model_name": "bert-base-uncased",
+        "task": "feature-extraction"
+    }
+
+    response = client.post("/predict?pool=max", json=test_request)
+    assert response.status_code == 422
+
+
+@pytest.mark.usefixtures("bert_base_loaded")
+def test_predict_raw_endpoint() -> None:
+    """Test the raw float16 prediction endpoint"""
+    test_request = {
+        "text": "Hello world",
+        "model_name": "bert-base-uncased"
+    }
+
+    response = client.post("/predict_raw", json=test_request)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/octet-stream"
+    rows, columns = map(int, response.headers["x-shape"].split(","))
+    assert len(response.content) == rows * columns * 2
+
+
+def test_predict_model_not_loaded() -> None:
+    """Test prediction with a supported model that is not loaded"""
+    test_request = {
+        "text": "Hello world",
+        "model_name": "albert-base-v1",
+        "task": "feature-extraction"
+    }
+
+    response = client.post("/predict", json=test_request)
+    assert response.status_code == 503
+    data: Dict[str, Any] = response.json()
+    assert "albert-base-v1 is not loaded" in data["detail"]
+
+
 def test_invalid_model() -> None:
     """Test prediction with invalid model"""
     test_request = {
@@ -64,3 +181,137 @@ def test_invalid_model() -> None:
     data: Dict[str, Any] = response.json()
     assert "detail" in data
     assert "invalid-model not supported" in data["detail"]
+
+
+def test_micro_batcher_coalesces_requests() -> None:
+    """Test that concurrent texts are split into batches of at most max_batch"""
+    calls: List[List[str]] = []
+
+    def process_batch(model_name: str, texts: List[str]) -> List[str]:
+        calls.append(list(texts))
+        return [f"{model_name}:{text.upper()}" for text in texts]
+
+    batcher = MicroBatcher(process_batch, max_batch=4, max_wait_ms=50)
+
+    async def submit_all() -> List[Any]:
+        return await asyncio.gather(
+            *(batcher.submit("m", text) for text in ["a", "b", "c", "d", "e"]))
+
+    results = asyncio.run(submit_all())
+    assert results == ["m:A", "m:B", "m:C", "m:D", "m:E"]
+    assert [len(texts) for texts in calls] == [4, 1]
+
+
+def test_micro_batcher_separates_models() -> None:
+    """Test that texts for different models never share a batch"""
+    calls: List[str] = []
+
+    def process_batch(model_name: str, texts: List[str]) -> List[str]:
+        calls.append(model_name)
+        return [model_name for _ in texts]
+
+    batcher = MicroBatcher(process_batch, max_batch=8, max_wait_ms=10)
+
+    async def submit_all() -> List[Any]:
+        return await asyncio.gather(
+            *(batcher.submit(model_name, text)
+              for model_name, text in [("first", "a"), ("second", "b"), ("first", "c")]))
+
+    assert asyncio.run(submit_all()) == ["first", "second", "first"]
+    assert sorted(calls) == ["first", "second"]
+
+
+def test_micro_batcher_propagates_errors() -> None:
+    """Test that a failing batch fails every caller in it"""
+    def process_batch(model_name: str, texts: List[str]) -> List[str]:
+        raise ValueError("boom")
+
+    batcher = MicroBatcher(process_batch, max_batch=8, max_wait_ms=10)
+
+    async def submit_all() -> List[Any]:
+        return await asyncio.gather(
+            *(batcher.submit("m", text) for text in ["a", "b", "c"]),
+            return_exceptions=True)
+
+    results = asyncio.run(submit_all())
+    assert len(results) == 3
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_micro_batcher_new_event_loop() -> None:
+    """Test that the batcher keeps working when used from a new event loop"""
+    def process_batch(model_name: str, texts: List[str]) -> List[str]:
+        return list(texts)
+
+    batcher = MicroBatcher(process_batch, max_batch=8, max_wait_ms=10)
+    assert asyncio.run(batcher.submit("m", "first")) == "first"
+    assert asyncio.run(batcher.submit("m", "second")) == "second"
+
+
+class FakeBatcher:
+    """Stand-in for the model batcher that counts the texts it receives"""
+
+    def __init__(self) -> None:
+        self.texts: List[str] = []
+
+    async def submit(self, model_name: str, text: str) -> torch.Tensor:
+        self.texts.append(text)
+        return torch.zeros(2, 4)
+
+
+@pytest.fixture
+def fake_batcher(monkeypatch: pytest.MonkeyPatch) -> FakeBatcher:
+    """Route embed() to a fake batcher with an empty result cache"""
+    batcher = FakeBatcher()
+    monkeypatch.setattr(main, "batcher", batcher)
+    monkeypatch.setattr(main, "result_cache", OrderedDict())
+    monkeypatch.setattr(main, "result_cache_bytes", 0)
+    return batcher
+
+
+def test_embed_reuses_cached_results(fake_batcher: FakeBatcher) -> None:
+    """Test that a repeated text is served from the result cache"""
+    async def embed_twice() -> None:
+        await main.embed("m", "hello")
+        await main.embed("m", "hello")
+        await main.embed("other", "hello")
+
+    asyncio.run(embed_twice())
+    assert fake_batcher.texts == ["hello", "hello"]
+
+
+def test_embed_evicts_least_recently_used(
+    fake_batcher: FakeBatcher,
+    monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test that the result cache drops the least recently used entry"""
+    monkeypatch.setattr(main, "RESULT_CACHE_SIZE", 2)
+
+    async def embed_all() -> None:
+        await main.embed("m", "a")
+        await main.embed("m", "b")
+        await main.embed("m", "a")  # "b" is now least recently used
+        await main.embed("m", "c")
+        await main.embed("m", "a")
+        await main.embed("m", "b")
+
+    asyncio.run(embed_all())
+    assert fake_batcher.texts == ["a", "b", "c", "b"]
+    assert len(main.result_cache) == 2
+    assert main.result_cache_bytes == sum(
+        embeddings.nbytes for embeddings in main.result_cache.values())
+
+
+def test_get_preload_models(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test parsing of the PRELOAD_MODELS setting"""
+    monkeypatch.setattr(main, "PRELOAD_MODELS", "all")
+    assert main.get_preload_models() == list(main.SUPPORTED_MODELS.keys())
+
+    monkeypatch.setattr(main, "PRELOAD_MODELS", "none")
+    assert main.get_preload_models() == []
+
+    monkeypatch.setattr(main, "PRELOAD_MODELS", "")
+    assert main.get_preload_models() == []
+
+    monkeypatch.setattr(main, "PRELOAD_MODELS", " Roberta-Base, unknown-model,bert-base-uncased ")
+    assert main.get_preload_models() == ["roberta-base", "bert-base-uncased"]